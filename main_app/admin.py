@@ -1,11 +1,20 @@
 from django.contrib import admin
 # import your models here
-from .models import Cat, Feeding, Toy, Photo
+from .models import Cat, Feeding, Toy, Photo, CatPurge, ActivityEvent
 
 # Register your models here.
-admin.site.register(Cat)
+# "delete selected" in the admin should soft-delete too, not cascade
+class CatAdmin(admin.ModelAdmin):
+    def delete_queryset(self, request, queryset):
+        for cat in queryset:
+            cat.soft_delete()
+
+admin.site.register(Cat, CatAdmin)
 # register our new feeding model
 admin.site.register(Feeding)
 
 admin.site.register(Toy)
-admin.site.register(Photo)
\ No newline at end of file
+admin.site.register(Photo)
+# so we can watch how the background purges are doing
+admin.site.register(CatPurge)
+admin.site.register(ActivityEvent)
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from main_app.models import Cat, Feeding, Photo, ActivityEvent
+
+# builds the activity log for data that was there before we started logging
+# safe to run more than once, anything that already has an event is skipped
+# run it once after migrating: python manage.py backfill_activity
+class Command(BaseCommand):
+    help = 'Backfill the activity log from existing feedings, photos and toys'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        total = 0
+        # skip soft-deleted cats, the purge is about to remove them anyway
+        for cat_id in Cat.objects.order_by('id').values_list('id', flat=True).iterator():
+            total += self.backfill_cat(cat_id, batch_size)
+        self.stdout.write(f'Created {total} activity events')
+
+    def backfill_cat(self, cat_id, batch_size):
+        seen = set(ActivityEvent.objects.filter(cat_id=cat_id).values_list('kind', 'object_id'))
+        events = []
+        # feedings get the same time the live log gives them
+        # photos and toys never had a timestamp so they get now
+        for feeding in Feeding.objects.filter(cat_id=cat_id).only('id', 'date').iterator():
+            if ('F', feeding.id) not in seen:
+                events.append(ActivityEvent(cat_id=cat_id, kind='F', object_id=feeding.id, created_at=feeding.fed_at()))
+        for id in Photo.objects.filter(cat_id=cat_id).order_by('id').values_list('id', flat=True).iterator():
+            if ('P', id) not in seen:
+                events.append(ActivityEvent(cat_id=cat_id, kind='P', object_id=id))
+        toys = Cat.toys.through.objects.filter(cat_id=cat_id).order_by('id').values_list('toy_id', flat=True)
+        for id in toys.iterator():
+            if ('T', id) not in seen:
+                events.append(ActivityEvent(cat_id=cat_id, kind='T', object_id=id))
+        ActivityEvent.objects.bulk_create(events, batch_size=batch_size)
+        return len(events)
@@ -0,0 +1,115 @@
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+import boto3 #what we'll use to connect to s3
+from django.conf import settings
+from main_app.models import Cat, Feeding, Photo, CatPurge, ActivityEvent
+
+AWS_ACCESS_KEY = settings.AWS_ACCESS_KEY
+AWS_SECRET_ACCESS_KEY = settings.AWS_SECRET_ACCESS_KEY
+S3_BUCKET = settings.S3_BUCKET
+S3_BASE_URL = settings.S3_BASE_URL
+
+# a running purge that hasn't saved any progress for this long is from a run that crashed
+STALE_AFTER = timedelta(minutes=10)
+
+# deleting a cat only marks it as deleted, this command does the heavy lifting
+# every batch is its own transaction and bumps the counters on the CatPurge row,
+# so if the command dies half way through we just run it again and it picks up where it left off
+# run it on a schedule: python manage.py purge_cats
+# overlapping runs are fine, each purge is claimed by one run at a time
+class Command(BaseCommand):
+    help = 'Purge feedings, photos, toys, activity and s3 objects for soft-deleted cats in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--cat', type=int, help='only purge this cat_id')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # cats soft-deleted without a purge (like when their user was deleted) get one now
+        orphans = Cat.all_objects.filter(deleted_at__isnull=False).exclude(id__in=CatPurge.objects.values('cat_id'))
+        for cat_id in orphans.values_list('id', flat=True):
+            CatPurge.objects.get_or_create(cat_id=cat_id)
+        purges = CatPurge.objects.exclude(status='D')
+        if options['cat']:
+            purges = purges.filter(cat_id=options['cat'])
+        s3 = boto3.client('s3', aws_access_key_id=AWS_ACCESS_KEY, aws_secret_access_key=AWS_SECRET_ACCESS_KEY)
+        for purge in purges:
+            self.purge_cat(purge, s3, batch_size)
+
+    def claim(self, purge):
+        # flip the purge to running only if nobody else has it
+        # running purges are picked up again once they go stale, that's a run that crashed
+        now = timezone.now()
+        claimable = Q(status__in=['P', 'F']) | Q(status='R', updated_at__lt=now - STALE_AFTER)
+        return CatPurge.objects.filter(claimable, id=purge.id).update(status='R', last_error='', updated_at=now) == 1
+
+    def purge_cat(self, purge, s3, batch_size):
+        if not self.claim(purge):
+            return
+        try:
+            # go around again if a photo showed up while we were working
+            finished = False
+            while not finished:
+                while self.purge_photos(purge, s3, batch_size):
+                    pass
+                while self.purge_rows(purge, Feeding.objects, 'feedings_deleted', batch_size):
+                    pass
+                while self.purge_rows(purge, Cat.toys.through.objects, 'toys_removed', batch_size):
+                    pass
+                while self.purge_rows(purge, ActivityEvent.objects, 'events_deleted', batch_size):
+                    pass
+                finished = self.finish(purge)
+        except Exception as error:
+            CatPurge.objects.filter(id=purge.id).update(status='F', last_error=str(error), updated_at=timezone.now())
+            self.stderr.write(f'Error purging cat_id: {purge.cat_id} {error}')
+            return
+        self.stdout.write(f'Purged cat_id: {purge.cat_id}')
+
+    def finish(self, purge):
+        with transaction.atomic():
+            # lock the cat so add_photo can't save a photo while we finish up
+            list(Cat.all_objects.select_for_update().filter(id=purge.cat_id))
+            # the cascade below would drop a late photo's row but leave its s3 file
+            if Photo.objects.filter(cat_id=purge.cat_id).exists():
+                return False
+            # nothing is left pointing at the cat, so this delete is quick
+            Cat.all_objects.filter(id=purge.cat_id).delete()
+            now = timezone.now()
+            CatPurge.objects.filter(id=purge.id).update(status='D', finished_at=now, updated_at=now)
+        return True
+
+    def purge_photos(self, purge, s3, batch_size):
+        # s3 only lets us delete 1000 objects per request
+        # order by id so we walk the primary key instead of sorting all the cat's rows every batch
+        photos = list(Photo.objects.filter(cat_id=purge.cat_id).order_by('id').values_list('id', 'url')[:min(batch_size, 1000)])
+        if not photos:
+            return False
+        # the key is whatever comes after the bucket in the url we built in add_photo
+        prefix = f"{S3_BASE_URL}{S3_BUCKET}/"
+        keys = [{'Key': url[len(prefix):]} for id, url in photos if url.startswith(prefix)]
+        # remove the files first, deleting them twice is harmless if the rows survive
+        if keys:
+            response = s3.delete_objects(Bucket=S3_BUCKET, Delete={'Objects': keys, 'Quiet': True})
+            if response.get('Errors'):
+                raise Exception(f"could not delete {response['Errors'][0]['Key']}: {response['Errors'][0]['Message']}")
+        self.delete_batch(purge, Photo.objects, [id for id, url in photos], 'photos_deleted')
+        return True
+
+    def purge_rows(self, purge, manager, counter, batch_size):
+        # feedings default to ordering by date, which would sort every remaining row each batch
+        ids = list(manager.filter(cat_id=purge.cat_id).order_by('id').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return False
+        self.delete_batch(purge, manager, ids, counter)
+        return True
+
+    def delete_batch(self, purge, manager, ids, counter):
+        # delete the rows and record our progress together
+        with transaction.atomic():
+            deleted = manager.filter(id__in=ids).delete()[0]
+            # add in the database so we never write back a stale count
+            CatPurge.objects.filter(id=purge.id).update(**{counter: F(counter) + deleted, 'updated_at': timezone.now()})
@@ -0,0 +1,36 @@
+# Generated by Django 4.1.7 on 2026-10-19 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0005_cat_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatPurge',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cat_id', models.BigIntegerField(unique=True)),
+                ('status', models.CharField(choices=[('P', 'Pending'), ('R', 'Running'), ('F', 'Failed'), ('D', 'Done')], default='P', max_length=1)),
+                ('photos_deleted', models.IntegerField(default=0)),
+                ('feedings_deleted', models.IntegerField(default=0)),
+                ('toys_removed', models.IntegerField(default=0)),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['created_at'],
+            },
+        ),
+        migrations.AddField(
+            model_name='cat',
+            name='deleted_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 4.1.7 on 2026-10-19 10:54
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main_app', '0006_cat_deleted_at_catpurge'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='catpurge',
+            name='events_deleted',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ActivityEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('F', 'Fed'), ('P', 'Photo added'), ('T', 'Toy added'), ('U', 'Toy removed')], max_length=1)),
+                ('object_id', models.BigIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('cat', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='main_app.cat')),
+            ],
+            options={
+                'ordering': ['-created_at', '-id'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='activityevent',
+            index=models.Index(fields=['cat', '-created_at', '-id'], name='activity_cat_timeline_idx'),
+        ),
+    ]
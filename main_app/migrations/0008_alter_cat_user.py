@@ -0,0 +1,21 @@
+# Generated by Django 4.1.7 on 2026-10-19 11:01
+
+from django.conf import settings
+from django.db import migrations, models
+import main_app.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('main_app', '0007_activityevent'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cat',
+            name='user',
+            field=models.ForeignKey(null=True, on_delete=main_app.models.SOFT_DELETE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,6 +1,7 @@
-from django.db import models
+from django.db import models, transaction
 from django.urls import reverse
-from datetime import date
+from django.utils import timezone
+from datetime import date, datetime, time
 # import django's built in user model
 from django.contrib.auth.models import User
 
@@ -10,6 +11,22 @@ MEALS = (
     ('L', 'Lunch'),
     ('D', 'Dinner')
 )
+
+# statuses for a background cat purge
+PURGE_STATUSES = (
+    ('P', 'Pending'),
+    ('R', 'Running'),
+    ('F', 'Failed'),
+    ('D', 'Done')
+)
+
+# kinds of things that show up on a cat's activity timeline
+ACTIVITY_KINDS = (
+    ('F', 'Fed'),
+    ('P', 'Photo added'),
+    ('T', 'Toy added'),
+    ('U', 'Toy removed')
+)
 # Create your models here.
 class Toy(models.Model):
     name = models.CharField(max_length=50)
@@ -21,6 +38,18 @@ class Toy(models.Model):
     def get_absolute_url(self):
         return reverse('toys_detail', kwargs={'pk': self.id})
 
+# used as on_delete for a cat's user, so deleting a user soft-deletes their cats
+# instead of cascading through all their feedings and photos in one go
+# purge_cats picks these cats up and queues a purge for them
+def SOFT_DELETE(collector, field, sub_objs, using):
+    collector.add_field_update(field, None, sub_objs)
+    collector.add_field_update(sub_objs.model._meta.get_field('deleted_at'), timezone.now(), sub_objs)
+
+# by default we only want to see cats that haven't been soft-deleted
+class ActiveCatManager(models.Manager):
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 class Cat(models.Model):
     name = models.CharField(max_length=100)
     breed = models.CharField(max_length=100)
@@ -28,7 +57,15 @@ class Cat(models.Model):
     age = models.IntegerField()
     toys = models.ManyToManyField(Toy)
     # add foreign key ref to user
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    # the user is cleared when they are deleted, their cats are soft-deleted with them
+    user = models.ForeignKey(User, on_delete=SOFT_DELETE, null=True)
+    # set when the cat is deleted, the actual rows are purged later in batches
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    # the first manager is the default one, so deleted cats are hidden everywhere
+    objects = ActiveCatManager()
+    # use this one when we need to see the deleted cats too (like the purge)
+    all_objects = models.Manager()
 
     def fed_for_today(self):
         return self.feeding_set.filter(date=date.today()).count() >= len(MEALS)
@@ -41,6 +78,32 @@ class Cat(models.Model):
     def get_absolute_url(self):
         return reverse('detail', kwargs={'cat_id': self.id })
 
+    # mark the cat as deleted and queue up a purge for everything that belongs to it
+    # both happen together so a hidden cat always has a purge
+    def soft_delete(self):
+        with transaction.atomic():
+            self.deleted_at = timezone.now()
+            self.save(update_fields=['deleted_at'])
+            return CatPurge.objects.get_or_create(cat_id=self.id)[0]
+
+    # deleting a cat (from the views or the admin) only soft-deletes it
+    # the purge_cats command does the real delete
+    def delete(self, *args, **kwargs):
+        self.soft_delete()
+
+    # one page of the cat's activity, newest first
+    # pass the last event you saw as before to get the next page
+    def timeline(self, before=None, limit=20):
+        events = self.activityevent_set.all()
+        if before:
+            # the first filter is what lets the index range start at the cursor
+            # created_at can repeat, so the second one uses the id to break the tie
+            events = events.filter(created_at__lte=before.created_at).filter(
+                models.Q(created_at__lt=before.created_at) |
+                models.Q(created_at=before.created_at, id__lt=before.id)
+            )
+        return events[:limit]
+
 # Add new Feeding model below Cat model
 class Feeding(models.Model):
     date = models.DateField('feeding date')
@@ -58,6 +121,17 @@ class Feeding(models.Model):
         # this method is coming from django
         # produced like this: get_<name_of_field>_display()
         return f"{self.get_meal_display()} on {self.date}"
+
+    # the activity event is written in post_save, so save them together
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+    # feedings only have a date, so they go on the timeline at midnight of that day
+    def fed_at(self):
+        # date might still be a string like '2023-01-01' if it was never cleaned
+        fed_on = self._meta.get_field('date').to_python(self.date)
+        return timezone.make_aware(datetime.combine(fed_on, time.min))
     
     # change the default sort
     class Meta:
@@ -68,4 +142,52 @@ class Photo(models.Model):
     cat = models.ForeignKey(Cat, on_delete=models.CASCADE)
 
     def __str__(self):
-        return f"Photo for cat_id: {self.cat_id} @{self.url}"
\ No newline at end of file
+        return f"Photo for cat_id: {self.cat_id} @{self.url}"
+
+    # the activity event is written in post_save, so save them together
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+
+# keeps track of a background purge so it can be resumed and watched in the admin
+class CatPurge(models.Model):
+    # not a foreign key, the cat row is gone by the time the purge is done
+    cat_id = models.BigIntegerField(unique=True)
+    status = models.CharField(
+        max_length=1,
+        choices = PURGE_STATUSES,
+        default = PURGE_STATUSES[0][0]
+    )
+    # progress counters, updated after every batch
+    photos_deleted = models.IntegerField(default=0)
+    feedings_deleted = models.IntegerField(default=0)
+    toys_removed = models.IntegerField(default=0)
+    events_deleted = models.IntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Purge for cat_id: {self.cat_id} ({self.get_status_display()})"
+
+    class Meta:
+        ordering = ['created_at']
+
+# append-only log of what happened to a cat, written by the handlers in signals.py
+# and by the backfill_activity command for data from before the log existed
+class ActivityEvent(models.Model):
+    cat = models.ForeignKey(Cat, on_delete=models.CASCADE)
+    kind = models.CharField(max_length=1, choices=ACTIVITY_KINDS)
+    # id of the feeding, photo or toy the event is about
+    object_id = models.BigIntegerField()
+    # when it happened, the timeline is sorted by this
+    created_at = models.DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} ({self.object_id}) for cat_id: {self.cat_id}"
+
+    class Meta:
+        ordering = ['-created_at', '-id']
+        # a cat's timeline is one range scan over this index
+        indexes = [models.Index(fields=['cat', '-created_at', '-id'], name='activity_cat_timeline_idx')]
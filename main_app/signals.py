@@ -0,0 +1,43 @@
+from django.db.models.signals import post_save, pre_delete, m2m_changed
+from django.dispatch import receiver
+from .models import Cat, Toy, Feeding, Photo, ActivityEvent
+
+# these handlers write to the activity log whenever a cat's feedings, photos or toys change
+# they're hooked up in apps.py so the admin gets logged too, not just our views
+
+@receiver(post_save, sender=Feeding)
+def log_feeding(sender, instance, created, **kwargs):
+    if created:
+        ActivityEvent.objects.create(cat_id=instance.cat_id, kind='F', object_id=instance.id, created_at=instance.fed_at())
+
+@receiver(post_save, sender=Photo)
+def log_photo(sender, instance, created, **kwargs):
+    if created:
+        ActivityEvent.objects.create(cat_id=instance.cat_id, kind='P', object_id=instance.id)
+
+@receiver(m2m_changed, sender=Cat.toys.through)
+def log_toys(sender, instance, action, reverse, pk_set, **kwargs):
+    # the toys table has no timestamps, so this is the only record of when toys come and go
+    if action in ('post_add', 'post_remove'):
+        kind = 'T' if action == 'post_add' else 'U'
+    elif action == 'pre_clear':
+        # pk_set is empty on a clear, so look up what's about to be removed
+        kind = 'U'
+        if reverse:
+            pk_set = set(instance.cat_set.values_list('id', flat=True))
+        else:
+            pk_set = set(instance.toys.values_list('id', flat=True))
+    else:
+        return
+    # reverse means the change came from the toy side (toy.cat_set.add)
+    if reverse:
+        events = [ActivityEvent(cat_id=cat_id, kind=kind, object_id=instance.id) for cat_id in pk_set]
+    else:
+        events = [ActivityEvent(cat_id=instance.id, kind=kind, object_id=toy_id) for toy_id in pk_set]
+    ActivityEvent.objects.bulk_create(events)
+
+@receiver(pre_delete, sender=Toy)
+def log_toy_deleted(sender, instance, **kwargs):
+    # deleting a toy drops it from every cat without an m2m_changed, so log the removals here
+    cat_ids = Cat.toys.through.objects.filter(toy_id=instance.id).values_list('cat_id', flat=True)
+    ActivityEvent.objects.bulk_create([ActivityEvent(cat_id=cat_id, kind='U', object_id=instance.id) for cat_id in cat_ids])
@@ -1,3 +1,244 @@
+from datetime import date, timedelta
+from unittest import mock
 from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .management.commands.purge_cats import Command
+from .models import Cat, Toy, Feeding, Photo, CatPurge, ActivityEvent
 
 # Create your tests here.
+class CatPurgeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='tester', password='catsarecool')
+        self.cat = Cat.objects.create(name='Biscuit', breed='Tabby', description='naps a lot', age=3, user=self.user)
+        self.cat.toys.add(Toy.objects.create(name='Mouse', color='Grey'))
+        for i in range(3):
+            Feeding.objects.create(date=date.today(), cat=self.cat)
+        for i in range(2):
+            Photo.objects.create(url=f"{settings.S3_BASE_URL}{settings.S3_BUCKET}/pic{i}.png", cat=self.cat)
+
+    def purge(self, s3):
+        # swap out the real s3 client for our mock
+        with mock.patch('main_app.management.commands.purge_cats.boto3.client', return_value=s3):
+            call_command('purge_cats', '--batch-size', '1', stdout=mock.Mock(), stderr=mock.Mock())
+
+    def test_soft_delete_hides_cat(self):
+        purge = self.cat.soft_delete()
+        self.assertFalse(Cat.objects.filter(id=self.cat.id).exists())
+        self.assertTrue(Cat.all_objects.filter(id=self.cat.id).exists())
+        self.assertEqual(purge.status, 'P')
+        # nothing gets deleted until the purge runs
+        self.assertEqual(Feeding.objects.filter(cat_id=self.cat.id).count(), 3)
+
+    def test_delete_view_soft_deletes(self):
+        self.client.login(username='tester', password='catsarecool')
+        response = self.client.post(f'/cats/{self.cat.id}/delete/')
+        self.assertRedirects(response, '/cats/', fetch_redirect_response=False)
+        self.assertTrue(CatPurge.objects.filter(cat_id=self.cat.id, status='P').exists())
+        # a deleted cat can't get new feedings
+        response = self.client.post(f'/cats/{self.cat.id}/add_feeding/', {'date': '2023-03-01', 'meal': 'B'})
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(Feeding.objects.filter(cat_id=self.cat.id).count(), 3)
+
+    def test_purge_deletes_everything_in_batches(self):
+        self.cat.soft_delete()
+        s3 = mock.Mock()
+        s3.delete_objects.return_value = {}
+        self.purge(s3)
+        purge = CatPurge.objects.get(cat_id=self.cat.id)
+        self.assertEqual(purge.status, 'D')
+        self.assertEqual((purge.photos_deleted, purge.feedings_deleted, purge.toys_removed), (2, 3, 1))
+        self.assertIsNotNone(purge.finished_at)
+        self.assertFalse(Cat.all_objects.filter(id=self.cat.id).exists())
+        # one s3 request per batch, keyed by what comes after the bucket in the url
+        keys = [call.kwargs['Delete']['Objects'] for call in s3.delete_objects.call_args_list]
+        self.assertEqual(keys, [[{'Key': 'pic0.png'}], [{'Key': 'pic1.png'}]])
+
+    def test_failed_purge_resumes(self):
+        self.cat.soft_delete()
+        s3 = mock.Mock()
+        s3.delete_objects.side_effect = [{}, {'Errors': [{'Key': 'pic1.png', 'Message': 'Access Denied'}]}]
+        self.purge(s3)
+        purge = CatPurge.objects.get(cat_id=self.cat.id)
+        self.assertEqual(purge.status, 'F')
+        self.assertIn('Access Denied', purge.last_error)
+        self.assertEqual(purge.photos_deleted, 1)
+        # the next run picks up from the second photo
+        s3.delete_objects.side_effect = None
+        s3.delete_objects.return_value = {}
+        self.purge(s3)
+        purge.refresh_from_db()
+        self.assertEqual(purge.status, 'D')
+        self.assertEqual(purge.last_error, '')
+        self.assertEqual((purge.photos_deleted, purge.feedings_deleted), (2, 3))
+        self.assertEqual(s3.delete_objects.call_args.kwargs['Delete']['Objects'], [{'Key': 'pic1.png'}])
+
+    def test_soft_delete_is_all_or_nothing(self):
+        with mock.patch('main_app.models.CatPurge.objects.get_or_create', side_effect=Exception('db went away')):
+            with self.assertRaises(Exception):
+                self.cat.soft_delete()
+        self.assertTrue(Cat.objects.filter(id=self.cat.id).exists())
+
+    def test_deleting_user_soft_deletes_cats(self):
+        self.user.delete()
+        cat = Cat.all_objects.get(id=self.cat.id)
+        self.assertIsNotNone(cat.deleted_at)
+        self.assertIsNone(cat.user_id)
+        self.assertEqual(Photo.objects.filter(cat_id=self.cat.id).count(), 2)
+        # the purge queues itself for cats that don't have one yet
+        s3 = mock.Mock()
+        s3.delete_objects.return_value = {}
+        self.purge(s3)
+        self.assertEqual(CatPurge.objects.get(cat_id=self.cat.id).status, 'D')
+        self.assertEqual(s3.delete_objects.call_count, 2)
+
+    def test_admin_delete_selected_soft_deletes(self):
+        User.objects.create_superuser(username='admin', password='catsarecool')
+        self.client.login(username='admin', password='catsarecool')
+        self.client.post('/admin/main_app/cat/', {'action': 'delete_selected', '_selected_action': [self.cat.id], 'post': 'yes'})
+        self.assertTrue(Cat.all_objects.filter(id=self.cat.id, deleted_at__isnull=False).exists())
+        self.assertTrue(CatPurge.objects.filter(cat_id=self.cat.id).exists())
+        self.assertEqual(Feeding.objects.filter(cat_id=self.cat.id).count(), 3)
+
+    def test_purge_batches_do_not_sort_by_date(self):
+        self.cat.soft_delete()
+        s3 = mock.Mock()
+        s3.delete_objects.return_value = {}
+        with CaptureQueriesContext(connection) as queries:
+            self.purge(s3)
+        selects = [q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'main_app_feeding' in q['sql'] and 'LIMIT' in q['sql']]
+        self.assertTrue(selects)
+        for sql in selects:
+            self.assertIn('ORDER BY "main_app_feeding"."id" ASC', sql)
+
+    def test_photo_upload_for_cat_deleted_mid_upload(self):
+        self.client.login(username='tester', password='catsarecool')
+        s3 = mock.Mock()
+        # the cat gets deleted while the file is on its way to s3
+        s3.upload_fileobj.side_effect = lambda *args: self.cat.soft_delete()
+        with mock.patch('main_app.views.boto3.client', return_value=s3):
+            self.client.post(f'/cats/{self.cat.id}/add_photo/', {'photo-file': SimpleUploadedFile('new.png', b'meow')})
+        self.assertEqual(Photo.objects.filter(cat_id=self.cat.id).count(), 2)
+        self.assertEqual(s3.delete_object.call_args.kwargs['Bucket'], settings.S3_BUCKET)
+        self.assertTrue(s3.delete_object.call_args.kwargs['Key'].endswith('.png'))
+
+    def test_late_photo_is_purged_before_cat(self):
+        self.cat.soft_delete()
+        s3 = mock.Mock()
+        s3.delete_objects.return_value = {}
+        finish = Command.finish
+        # a photo lands after we went through the photos but before the cat is deleted
+        calls = []
+        def finish_with_late_photo(command, purge):
+            calls.append(purge)
+            if len(calls) == 1:
+                Photo.objects.create(url=f"{settings.S3_BASE_URL}{settings.S3_BUCKET}/late.png", cat_id=purge.cat_id)
+            return finish(command, purge)
+        with mock.patch.object(Command, 'finish', finish_with_late_photo):
+            self.purge(s3)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(CatPurge.objects.get(cat_id=self.cat.id).photos_deleted, 3)
+        self.assertEqual(s3.delete_objects.call_args.kwargs['Delete']['Objects'], [{'Key': 'late.png'}])
+
+    def test_running_purge_is_not_picked_up_twice(self):
+        purge = self.cat.soft_delete()
+        CatPurge.objects.filter(id=purge.id).update(status='R')
+        self.purge(mock.Mock())
+        purge.refresh_from_db()
+        self.assertEqual(purge.status, 'R')
+        self.assertEqual(Feeding.objects.filter(cat_id=self.cat.id).count(), 3)
+
+class ActivityTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='tester', password='catsarecool')
+        self.cat = Cat.objects.create(name='Biscuit', breed='Tabby', description='naps a lot', age=3, user=user)
+        self.toy = Toy.objects.create(name='Mouse', color='Grey')
+
+    def kinds(self):
+        return [(event.kind, event.object_id) for event in self.cat.timeline()]
+
+    def test_feedings_and_photos_are_logged(self):
+        feeding = Feeding.objects.create(date=date(2023, 3, 1), cat=self.cat)
+        photo = Photo.objects.create(url='https://example.com/pic.png', cat=self.cat)
+        self.assertEqual(self.kinds(), [('P', photo.id), ('F', feeding.id)])
+        # feedings go on the timeline at their feeding date
+        self.assertEqual(self.cat.timeline()[1].created_at, feeding.fed_at())
+
+    def test_toys_are_logged_both_directions(self):
+        self.cat.toys.add(self.toy)
+        self.toy.cat_set.remove(self.cat)
+        self.toy.cat_set.add(self.cat)
+        self.assertEqual(
+            sorted(ActivityEvent.objects.values_list('kind', flat=True)),
+            ['T', 'T', 'U']
+        )
+
+    def test_clear_is_logged_both_directions(self):
+        self.cat.toys.add(self.toy)
+        self.cat.toys.clear()
+        self.assertEqual(ActivityEvent.objects.filter(kind='U', cat=self.cat, object_id=self.toy.id).count(), 1)
+        self.cat.toys.add(self.toy)
+        self.toy.cat_set.clear()
+        self.assertEqual(ActivityEvent.objects.filter(kind='U', cat=self.cat, object_id=self.toy.id).count(), 2)
+
+    def test_feeding_date_can_be_a_string(self):
+        feeding = Feeding.objects.create(date='2023-01-01', cat=self.cat)
+        self.assertEqual(self.kinds(), [('F', feeding.id)])
+        self.assertEqual(self.cat.timeline()[0].created_at.date(), date(2023, 1, 1))
+
+    def test_feeding_is_not_saved_without_its_event(self):
+        with mock.patch('main_app.signals.ActivityEvent.objects.create', side_effect=Exception('db went away')):
+            with self.assertRaises(Exception):
+                Feeding.objects.create(date=date(2023, 1, 1), cat=self.cat)
+        self.assertFalse(Feeding.objects.exists())
+
+    def test_deleting_toy_is_logged(self):
+        self.cat.toys.add(self.toy)
+        toy_id = self.toy.id
+        self.toy.delete()
+        self.assertEqual(self.kinds(), [('U', toy_id), ('T', toy_id)])
+
+    def test_timeline_pages(self):
+        # a few feedings on the same day so paging has to break ties on id
+        for days in [0, 0, 0, 1, 2]:
+            Feeding.objects.create(date=date(2023, 3, 10) - timedelta(days=days), cat=self.cat)
+        everything = list(self.cat.timeline())
+        first = list(self.cat.timeline(limit=2))
+        second = list(self.cat.timeline(before=first[-1], limit=2))
+        third = list(self.cat.timeline(before=second[-1], limit=2))
+        self.assertEqual(first + second + third, everything)
+        self.assertEqual(len(everything), 5)
+        self.assertEqual(everything, sorted(everything, key=lambda event: (event.created_at, event.id), reverse=True))
+
+    def test_timeline_page_seeks_to_cursor(self):
+        Feeding.objects.create(date=date(2023, 3, 10), cat=self.cat)
+        cursor = self.cat.timeline()[0]
+        page = self.cat.timeline(before=cursor)
+        # the cursor has to be AND-ed on its own, an OR can't bound the index range
+        self.assertIn('AND "main_app_activityevent"."created_at" <=', str(page.query))
+        if connection.vendor == 'sqlite':
+            self.assertIn('activity_cat_timeline_idx (cat_id=? AND created_at<?)', page.explain())
+
+    def test_backfill_orders_by_time_and_skips_existing(self):
+        # a live event from before the backfill runs
+        today = Feeding.objects.create(date=date.today(), cat=self.cat)
+        # and old data that was never logged
+        with mock.patch('main_app.signals.ActivityEvent.objects.create'):
+            old = Feeding.objects.create(date=date(2020, 1, 1), cat=self.cat)
+        Cat.toys.through.objects.create(cat=self.cat, toy=self.toy)
+        call_command('backfill_activity', stdout=mock.Mock())
+        call_command('backfill_activity', stdout=mock.Mock())
+        self.assertEqual(ActivityEvent.objects.count(), 3)
+        # the old feeding sorts last even though it was written last
+        self.assertEqual(self.kinds()[-1], ('F', old.id))
+        self.assertIn(('F', today.id), self.kinds())
+
+    def test_backfill_skips_deleted_cats(self):
+        Cat.toys.through.objects.create(cat=self.cat, toy=self.toy)
+        self.cat.soft_delete()
+        call_command('backfill_activity', stdout=mock.Mock())
+        self.assertFalse(ActivityEvent.objects.exists())
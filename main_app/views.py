@@ -1,4 +1,4 @@
-from django.shortcuts import render, redirect
+from django.shortcuts import render, redirect, get_object_or_404
 from django.views.generic.edit import CreateView, UpdateView, DeleteView
 from django.views.generic import ListView
 from django.views.generic.detail import DetailView
@@ -7,6 +7,7 @@ from .forms import FeedingForm
 import uuid #python package for creating unique identifiers
 import boto3 #what we'll use to connect to s3
 from django.conf import settings
+from django.db import transaction
 # imports for signing up
 # we want to automatically log in signed up users
 from django.contrib.auth import login
@@ -79,12 +80,16 @@ class CatUpdate(LoginRequiredMixin, UpdateView):
     # let's use custom fields to disallow renaming a cat
     fields = ['breed', 'description', 'age']
 
+# Cat.delete only marks the cat as deleted
+# the feedings, photos and toys are cleaned up later by the purge_cats command
 class CatDelete(LoginRequiredMixin, DeleteView):
     model = Cat
     success_url = '/cats/'
 
 @login_required
 def add_feeding(request, cat_id):
+    # make sure the cat exists and hasn't been deleted
+    cat = get_object_or_404(Cat, id=cat_id)
     # create a ModelForm instance from the data in request.POST
     form = FeedingForm(request.POST)
 
@@ -92,7 +97,7 @@ def add_feeding(request, cat_id):
     if form.is_valid():
         # we dont want to save the form to the db until is has the cat id
         new_feeding = form.save(commit=False)
-        new_feeding.cat_id = cat_id
+        new_feeding.cat = cat
         new_feeding.save()
     return redirect('detail', cat_id=cat_id)
 
@@ -141,6 +146,8 @@ class ToyDelete(LoginRequiredMixin, DeleteView):
 # view for adding photos
 @login_required
 def add_photo(request, cat_id):
+    # a deleted cat might already have been purged, so don't upload anything for it
+    cat = get_object_or_404(Cat, id=cat_id)
     # photo-file will be the name attribute of our form input
     # input type will be file
     photo_file = request.FILES.get('photo-file', None)
@@ -160,9 +167,15 @@ def add_photo(request, cat_id):
             url = f"{S3_BASE_URL}{S3_BUCKET}/{key}"
             # if our upload(that used boto3) was successful
             # we want to use that photo location to create a Photo model
-            photo = Photo(url=url, cat_id=cat_id)
-            # save the instance to the db
-            photo.save()
+            # lock the cat so the purge can't finish between our check and the save
+            with transaction.atomic():
+                if Cat.objects.select_for_update().filter(id=cat_id).exists():
+                    photo = Photo(url=url, cat=cat)
+                    # save the instance to the db
+                    photo.save()
+                else:
+                    # the cat was deleted while we were uploading, don't leave the file behind
+                    s3.delete_object(Bucket=S3_BUCKET, Key=key)
         except Exception as error:
             # print an error message
             print('Error uploading photo', error)